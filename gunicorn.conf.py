@@ -0,0 +1,20 @@
+"""
+Gunicorn settings, loaded automatically when gunicorn starts from the project root.
+"""
+
+# Recycle workers periodically so memory held after large rewriting tasks
+# (PDF uploads, long Gemini responses) is returned to the OS
+max_requests = 100
+max_requests_jitter = 10
+
+
+# Seconds an exiting worker lets running tasks finish before marking them
+# failed; kept under timeout (30s) so the arbiter doesn't kill it first
+graceful_timeout = 25
+
+
+def worker_exit(server, worker):
+    """Fail tasks the exiting worker can't finish so they can be retried."""
+    from reframer.task import shutdown_task_pool
+
+    shutdown_task_pool(timeout=server.cfg.graceful_timeout - 5)
@@ -1,30 +1,33 @@
 import os
 from . import task
-from flask import Flask, render_template, redirect, url_for, request, session
+from .util import UploadRequest
+from cachelib.file import FileSystemCache
+from flask import Flask, render_template, redirect, url_for, request
+from flask_session import Session
+
+# App configuration, built once at import time
+_CONFIG = {
+    "SECRET_KEY": os.environ.get(
+        "SECRET_KEY", "dev"
+    ),  # Use environment variable in production
+    "MAX_CONTENT_LENGTH": 16 * 1024 * 1024,  # 16MB max file size
+    "UPLOAD_FOLDER": "instance/uploads",
+    "SESSION_PERMANENT": False,
+    "SESSION_SERIALIZATION_FORMAT": "msgpack",  # Compact binary session payloads
+}
 
 
 def create_app():
     # create and configure the app
-    app = Flask(__name__, instance_relative_config=True)
-    app.config.from_mapping(
-        SECRET_KEY=os.environ.get(
-            "SECRET_KEY", "dev"
-        ),  # Use environment variable in production
-        MAX_CONTENT_LENGTH=16 * 1024 * 1024,  # 16MB max file size
-        UPLOAD_FOLDER="instance/uploads",
-    )
-
-    # ensure the instance folder exists
-    try:
-        os.makedirs(app.instance_path)
-    except OSError:
-        pass
-
-    # ensure the uploads folder exists
-    try:
-        os.makedirs(os.path.join(app.instance_path, "uploads"))
-    except OSError:
-        pass
+    app = Flask(__name__)
+    app.request_class = UploadRequest
+    app.config.update(_CONFIG)
+
+    # ensure the instance and uploads folders exist
+    os.makedirs(os.path.join(app.instance_path, "uploads"), exist_ok=True)
+
+    # keep session data server-side; the cookie only carries the session ID
+    configure_session(app)
 
     # render index page
     @app.route("/", methods=["GET", "POST"])
@@ -38,3 +41,29 @@ def create_app():
     app.register_blueprint(task.bp)
 
     return app
+
+
+def configure_session(app):
+    """Store sessions in Redis when REDIS_URL is set, otherwise on disk."""
+    redis_url = os.environ.get("REDIS_URL")
+    if redis_url:
+        import redis
+
+        app.config.update(
+            SESSION_TYPE="redis",
+            SESSION_REDIS=redis.Redis.from_url(redis_url),
+        )
+    else:
+        app.config.update(
+            SESSION_TYPE="cachelib",
+            SESSION_CACHELIB=FileSystemCache(
+                os.path.join(app.instance_path, "sessions"),
+                # No size limit: past its threshold cachelib also deletes the
+                # oldest live sessions, orphaning those users' folders and
+                # tasks. Sessions expire after PERMANENT_SESSION_LIFETIME
+                # instead, and expired files are removed when next read.
+                threshold=0,
+            ),
+        )
+
+    Session(app)
@@ -3,62 +3,105 @@ Gemini AI client for rewriting articles based on instructions.
 Processes multiple articles and instructions to generate new content.
 """
 
+import gc
 import os
 import pathlib
-from google import genai
-from google.genai.errors import APIError
-from typing import List, Optional, Union
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Union
+from ..util import (
+    INPUT_FILE_RE,
+    MIME_PDF,
+    drop_file_cache,
+    get_preset_content,
+    read_prompt_file,
+)
+
+# Upper bound on concurrent file reads / Gemini uploads per task
+MAX_IO_WORKERS = 8
+
+# Uploaded Gemini files keyed by (path, st_mtime_ns, st_size), in LRU order
+_UPLOAD_CACHE = OrderedDict()
+_UPLOAD_CACHE_SIZE = 128
+_UPLOAD_CACHE_LOCK = threading.Lock()
+
+# PDF header check results keyed by (path, st_mtime_ns, st_size)
+_PDF_HEADER_CACHE = {}
+_PDF_HEADER_CACHE_SIZE = 1024
+
+
+def _has_pdf_header(file_path: str) -> bool:
+    """Check for the %PDF magic bytes, caching the result per file version."""
+    st = os.stat(file_path)
+    key = (file_path, st.st_mtime_ns, st.st_size)
+    valid = _PDF_HEADER_CACHE.get(key)
+    if valid is None:
+        # Raw fd read: no Python file object needed for 4 bytes
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            valid = os.read(fd, 4) == b"%PDF"
+        finally:
+            os.close(fd)
+        if len(_PDF_HEADER_CACHE) >= _PDF_HEADER_CACHE_SIZE:
+            _PDF_HEADER_CACHE.clear()
+        _PDF_HEADER_CACHE[key] = valid
+    return valid
 
 
 class RewritingClient:
     """Client for interacting with Google Gemini AI for article rewriting."""
 
     def __init__(self):
+        # Imported lazily: the SDK is heavy and only needed on the rewriting path
+        from google import genai
+
         api_key = os.getenv("GEMINI_API_KEY")
         self.client = genai.Client(api_key=api_key)
 
     def load_prompt_template(self, prompt_file_path: str) -> str:
         """Load the prompt template from file."""
         try:
-            with open(prompt_file_path, "r", encoding="utf-8") as f:
-                return f.read().strip()
+            return read_prompt_file(prompt_file_path)
         except Exception as e:
             raise Exception(f"Error loading prompt template: {str(e)}")
 
     def load_articles(self, article_file_paths: List[str]) -> List[Union[str, str]]:
         """Load article contents from file paths - text for .txt files, file paths for PDF files."""
-        articles = []
-        for file_path in article_file_paths:
-            try:
-                if file_path.lower().endswith(".pdf"):
-                    # Handle PDF files - validate and store path for upload
-                    if os.path.exists(file_path):
-                        # Validate PDF content (basic check)
-                        with open(file_path, "rb") as f:
-                            pdf_header = f.read(4)
-                            if pdf_header == b"%PDF":
-                                articles.append(file_path)  # Store path for upload
-                            else:
-                                print(
-                                    f"Warning: {file_path} does not appear to be a valid PDF file"
-                                )
-                    else:
-                        print(f"Warning: PDF file not found: {file_path}")
+        if not article_file_paths:
+            return []
+
+        # Reads are independent and I/O-bound, so load them concurrently
+        max_workers = min(MAX_IO_WORKERS, len(article_file_paths))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            loaded = executor.map(self._load_article, article_file_paths)
+            return [article for article in loaded if article is not None]
+
+    def _load_article(self, file_path: str) -> Optional[str]:
+        """Load a single article, returning None if it cannot be used."""
+        try:
+            if file_path.lower().endswith(".pdf"):
+                # Handle PDF files - validate and store path for upload
+                if _has_pdf_header(file_path):
+                    return file_path  # Store path for upload
                 else:
-                    # Handle text files
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        content = f.read().strip()
-                        if content:
-                            articles.append(content)
-                        else:
-                            print(f"Warning: {file_path} is empty")
-            except FileNotFoundError:
-                print(f"Warning: File not found: {file_path}")
-            except PermissionError:
-                print(f"Warning: Permission denied accessing: {file_path}")
-            except Exception as e:
-                print(f"Warning: Could not load article from {file_path}: {str(e)}")
-        return articles
+                    print(
+                        f"Warning: {file_path} does not appear to be a valid PDF file"
+                    )
+            else:
+                # Handle text files in a single read sized to the file
+                content = pathlib.Path(file_path).read_bytes().decode("utf-8").strip()
+                if content:
+                    return content
+                else:
+                    print(f"Warning: {file_path} is empty")
+        except FileNotFoundError:
+            print(f"Warning: File not found: {file_path}")
+        except PermissionError:
+            print(f"Warning: Permission denied accessing: {file_path}")
+        except Exception as e:
+            print(f"Warning: Could not load article from {file_path}: {str(e)}")
+        return None
 
     def load_instruction(
         self, instruction_file_path: str, preset_id: str = None
@@ -66,22 +109,16 @@ class RewritingClient:
         """Load instruction content from file or preset."""
         # If preset_id is provided, load preset content instead
         if preset_id:
-            try:
-                preset_file_path = os.path.join(
-                    os.path.dirname(__file__), "prompts", f"preset_{preset_id}.txt"
-                )
-                if os.path.exists(preset_file_path):
-                    with open(preset_file_path, "r", encoding="utf-8") as f:
-                        return f.read().strip()
-                else:
-                    print(f"Warning: Preset file not found: {preset_file_path}")
-            except Exception as e:
-                print(f"Warning: Error loading preset {preset_id}: {str(e)}")
+            preset_content = get_preset_content(preset_id)
+            if preset_content:
+                return preset_content
+            print(f"Warning: Preset not found: {preset_id}")
 
         # Fall back to regular instruction file
         try:
-            with open(instruction_file_path, "r", encoding="utf-8") as f:
-                return f.read().strip()
+            return (
+                pathlib.Path(instruction_file_path).read_bytes().decode("utf-8").strip()
+            )
         except Exception as e:
             return ""  # Return empty string if no instruction file
 
@@ -90,6 +127,14 @@ class RewritingClient:
     ) -> List:
         """Build content parts for Gemini API including text and file uploads."""
 
+        # Split articles once: load_articles returns PDF paths and text content
+        texts, pdf_paths = [], []
+        for article in articles:
+            if isinstance(article, str) and article.lower().endswith(".pdf"):
+                pdf_paths.append(article)
+            else:
+                texts.append(article)
+
         # Start with the prompt template
         content_parts = [prompt_template]
 
@@ -98,25 +143,62 @@ class RewritingClient:
             content_parts.append(instruction)
 
         # Add text articles
-        for article in articles:
-            if isinstance(article, str) and not article.lower().endswith(".pdf"):
-                content_parts.append(article)
+        content_parts.extend(texts)
 
-        # Upload PDF files and add them to content parts
-        for article in articles:
-            if (
-                isinstance(article, str)
-                and article.lower().endswith(".pdf")
-                and os.path.exists(article)
-            ):
-                try:
-                    uploaded_file = self.client.files.upload(file=pathlib.Path(article))
-                    content_parts.append(uploaded_file)
-                except Exception as e:
-                    print(f"Warning: Could not upload PDF file {article}: {str(e)}")
+        # Upload PDF files concurrently and add them to content parts in order.
+        # load_articles already checked that these files exist.
+        if pdf_paths:
+            max_workers = min(MAX_IO_WORKERS, len(pdf_paths))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                uploaded_files = executor.map(self._upload_pdf, pdf_paths)
+                content_parts.extend(f for f in uploaded_files if f is not None)
 
         return content_parts
 
+    def _upload_pdf(self, file_path: str):
+        """Upload a PDF file to Gemini, returning None if the upload fails."""
+        try:
+            # Reuse an earlier upload of the same file version when still usable
+            st = os.stat(file_path)
+            key = (file_path, st.st_mtime_ns, st.st_size)
+            uploaded_file = self._get_cached_upload(key)
+            if uploaded_file is None:
+                # Known MIME type: spares the SDK a mimetypes lookup per upload
+                uploaded_file = self.client.files.upload(
+                    file=pathlib.Path(file_path), config={"mime_type": MIME_PDF}
+                )
+                with _UPLOAD_CACHE_LOCK:
+                    _UPLOAD_CACHE[key] = uploaded_file
+                    if len(_UPLOAD_CACHE) > _UPLOAD_CACHE_SIZE:
+                        _UPLOAD_CACHE.popitem(last=False)
+                # Gemini now holds the bytes; keep the PDF out of the page cache
+                drop_file_cache(file_path)
+            return uploaded_file
+        except Exception as e:
+            print(f"Warning: Could not upload PDF file {file_path}: {str(e)}")
+            return None
+
+    def _get_cached_upload(self, key: tuple):
+        """Return a cached uploaded file if Gemini still reports it as active."""
+        with _UPLOAD_CACHE_LOCK:
+            uploaded_file = _UPLOAD_CACHE.get(key)
+            if uploaded_file is None:
+                return None
+            _UPLOAD_CACHE.move_to_end(key)
+
+        # Uploaded files expire server-side, so confirm before reusing
+        try:
+            current = self.client.files.get(name=uploaded_file.name)
+            state = getattr(current.state, "name", current.state)
+        except Exception:
+            current, state = None, None
+
+        if state != "ACTIVE":
+            with _UPLOAD_CACHE_LOCK:
+                _UPLOAD_CACHE.pop(key, None)
+            return None
+        return current
+
     def process_task(
         self, user_folder: str, prompt_file_path: str, preset_id: str = None
     ) -> str:
@@ -131,6 +213,21 @@ class RewritingClient:
         Returns:
             Generated rewritten content
         """
+        return "".join(self.stream_task(user_folder, prompt_file_path, preset_id))
+
+    def stream_task(
+        self, user_folder: str, prompt_file_path: str, preset_id: str = None
+    ) -> Iterator[str]:
+        """
+        Process a rewriting task, yielding the rewritten content as it arrives.
+
+        Takes the same arguments as process_task.
+
+        Yields:
+            Chunks of generated rewritten content
+        """
+        from google.genai.errors import APIError
+
         try:
             # Load prompt template
             prompt_template = self.load_prompt_template(prompt_file_path)
@@ -138,11 +235,10 @@ class RewritingClient:
             # Find all article files in user folder
             article_files = []
             if os.path.exists(user_folder):
-                for filename in os.listdir(user_folder):
-                    if filename.startswith("input") and (
-                        filename.endswith(".txt") or filename.endswith(".pdf")
-                    ):
-                        article_files.append(os.path.join(user_folder, filename))
+                with os.scandir(user_folder) as entries:
+                    for entry in entries:
+                        if INPUT_FILE_RE.match(entry.name) and entry.is_file():
+                            article_files.append(entry.path)
 
             # Load articles
             articles = self.load_articles(article_files)
@@ -158,14 +254,18 @@ class RewritingClient:
                 prompt_template, articles, instruction
             )
 
-            # Send to Gemini using modern SDK with mixed content
-            response = self.client.models.generate_content(
+            # Stream from Gemini using modern SDK with mixed content
+            response = self.client.models.generate_content_stream(
                 model="gemini-2.5-flash", contents=content_parts
             )
 
-            if response.text:
-                return response.text
-            else:
+            has_text = False
+            for chunk in response:
+                if chunk.text:
+                    has_text = True
+                    yield chunk.text
+
+            if not has_text:
                 raise Exception("No response generated from Gemini AI")
 
         except APIError as e:
@@ -178,3 +278,8 @@ class RewritingClient:
             if "pdf" in str(e).lower():
                 error_msg += "\nPDF processing error. Please check if the PDF file is valid and accessible."
             raise Exception(error_msg)
+        finally:
+            # Drop the large per-task buffers before the worker moves on, and
+            # collect cycles left behind by exception tracebacks
+            articles = content_parts = prompt_template = response = None
+            gc.collect()
@@ -3,10 +3,59 @@ Session management for the rewriter application.
 Handles all session-related operations including user sessions and task data.
 """
 
+import atexit
+import collections
+import contextlib
+import dataclasses
+import types
 import uuid
 import json
 import os
-from flask import session
+import queue
+import threading
+import time
+from flask import g, session
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library json module
+    orjson = None
+
+
+def _json_dumps(obj):
+    """Serialize obj to UTF-8 encoded JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _json_loads(data):
+    """Parse JSON from bytes or str."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Per user folder index of task log offsets, see SessionManager._task_offsets
+_TASK_INDEX = {}
+_TASK_INDEX_LOCK = threading.Lock()
+
+# (user_folder, task_id) -> ((log inode, log size), task view), least recently
+# used first; see SessionManager.get_task_by_id
+_TASK_CACHE = collections.OrderedDict()
+_TASK_CACHE_LOCK = threading.Lock()
+
+# Per user folder (inode, size) of the task log right after it was last
+# compacted, or when this process first wrote to it
+_TASK_LOG_BASELINE = {}
+
+# Guards SessionManager.claim_task within this process
+_TASK_CLAIM_LOCK = threading.Lock()
 
 
 class SessionManager:
@@ -15,6 +64,18 @@ class SessionManager:
     # Session key constants
     USER_ID_KEY = "user_id"
     CURRENT_TASK_KEY = "current_task"
+    INPUT_COUNTER_KEY = "input_counter"
+    USER_FOLDER_KEY = "user_folder"
+
+    # Task storage: an append-only JSON lines log per user folder
+    TASK_LOG_FILENAME = "tasks.jsonl"
+    LEGACY_TASKS_FILENAME = "tasks.json"
+    TASK_LOG_COMPACT_BYTES = 1024 * 1024  # Never compact a log under 1MB
+    TASK_LOG_GROWTH_FACTOR = 2  # Compact once the log doubles since last time
+    TASK_LOCK_FILENAME = "tasks.lock"  # Held while claiming a task
+    TASK_WRITE_LOCK_FILENAME = "tasks.jsonl.lock"  # Held while writing the log
+    TASK_CLAIM_TIMEOUT = 15 * 60  # Seconds before a processing claim is stale
+    TASK_CACHE_SIZE = 128  # Folded tasks kept in memory per process
 
     @staticmethod
     def get_user_id():
@@ -29,10 +90,49 @@ class SessionManager:
         """Check if the current session has a user ID."""
         return SessionManager.USER_ID_KEY in session
 
+    @staticmethod
+    def get_cached_user_folder():
+        """Get the user folder recorded for this session, if it was created."""
+        return session.get(SessionManager.USER_FOLDER_KEY)
+
+    @staticmethod
+    def set_cached_user_folder(user_folder):
+        """Record that the user folder for this session exists."""
+        session[SessionManager.USER_FOLDER_KEY] = user_folder
+        session.modified = True
+
+    @staticmethod
+    def get_and_increment_input_counter(user_folder):
+        """Reserve the next input file number for this user.
+
+        The folder is scanned once to seed the counter; later calls only
+        bump the number kept in the session.
+        """
+        counter = session.get(SessionManager.INPUT_COUNTER_KEY)
+        if counter is None:
+            # Imported here: util imports this module
+            from .util import get_next_input_number
+
+            number = get_next_input_number(user_folder)
+        else:
+            number = counter + 1
+        session[SessionManager.INPUT_COUNTER_KEY] = number
+        session.modified = True
+        return number
+
+    @staticmethod
+    def release_input_number(number):
+        """Let the next upload reuse number if it was the last one handed out."""
+        if session.get(SessionManager.INPUT_COUNTER_KEY) == number:
+            # Rescan on next use, matching the numbering of a fresh folder scan
+            session.pop(SessionManager.INPUT_COUNTER_KEY)
+            session.modified = True
+
     @staticmethod
     def clear_user_session():
         """Clear the entire user session."""
         session.clear()
+        SessionManager._invalidate_task_data()
 
     @staticmethod
     def initialize_task():
@@ -45,21 +145,40 @@ class SessionManager:
                 "preset_instruction": "",  # For preset instructions
             }
             session.modified = True
+            SessionManager._invalidate_task_data()
 
     @staticmethod
     def get_task_data():
         """Get current task data from session."""
-        return session.get(
-            SessionManager.CURRENT_TASK_KEY,
-            {"title": "", "articles": [], "instruction": "", "preset_instruction": ""},
-        )
+        # Looked up once per request; setters drop the cached reference
+        if "task_data" not in g:
+            g.task_data = session.get(
+                SessionManager.CURRENT_TASK_KEY,
+                {
+                    "title": "",
+                    "articles": [],
+                    "instruction": "",
+                    "preset_instruction": "",
+                },
+            )
+        return g.task_data
+
+    @staticmethod
+    def _invalidate_task_data():
+        """Forget the task data cached for this request."""
+        g.pop("task_data", None)
+        g.pop("article_index", None)
 
     @staticmethod
     def set_task_title(title):
         """Set the title for the current task."""
         SessionManager.initialize_task()
-        session[SessionManager.CURRENT_TASK_KEY]["title"] = title
+        task_data = session[SessionManager.CURRENT_TASK_KEY]
+        if task_data.get("title") == title:
+            return  # Unchanged, don't mark the session for saving
+        task_data["title"] = title
         session.modified = True
+        SessionManager._invalidate_task_data()
 
     @staticmethod
     def get_task_title():
@@ -70,9 +189,23 @@ class SessionManager:
     @staticmethod
     def add_article(article_data):
         """Add an article to the current task."""
+        SessionManager.add_articles([article_data])
+
+    @staticmethod
+    def add_articles(articles):
+        """Add several articles to the current task in one session update."""
         SessionManager.initialize_task()
-        session[SessionManager.CURRENT_TASK_KEY]["articles"].append(article_data)
+        # Sessions and the task log store plain dicts
+        session[SessionManager.CURRENT_TASK_KEY]["articles"].extend(
+            (
+                dataclasses.asdict(article_data)
+                if dataclasses.is_dataclass(article_data)
+                else article_data
+            )
+            for article_data in articles
+        )
         session.modified = True
+        SessionManager._invalidate_task_data()
 
     @staticmethod
     def get_articles():
@@ -88,28 +221,38 @@ class SessionManager:
             and "articles" in session[SessionManager.CURRENT_TASK_KEY]
         ):
             articles = session[SessionManager.CURRENT_TASK_KEY]["articles"]
+            index = SessionManager._article_index(articles).get(article_id)
 
-            # Find and return the article to be removed (for cleanup)
-            removed_article = None
-            for article in articles:
-                if article.get("id") == article_id:
-                    removed_article = article
-                    break
-
-            # Remove from session
-            session[SessionManager.CURRENT_TASK_KEY]["articles"] = [
-                article for article in articles if article.get("id") != article_id
-            ]
+            # Remove from session, leaving it untouched if nothing matched
+            if index is None:
+                return None
+            removed_article = articles.pop(index)
             session.modified = True
+            SessionManager._invalidate_task_data()
             return removed_article
         return None
 
+    @staticmethod
+    def _article_index(articles):
+        """Map article IDs to list positions, built once per request."""
+        # Kept in flask.g only, so the session payload stays a plain list
+        if "article_index" not in g:
+            index = {}
+            for position, article in enumerate(articles):
+                index.setdefault(article.get("id"), position)
+            g.article_index = index
+        return g.article_index
+
     @staticmethod
     def set_instruction(instruction):
         """Set the instruction for the current task."""
         SessionManager.initialize_task()
-        session[SessionManager.CURRENT_TASK_KEY]["instruction"] = instruction
+        task_data = session[SessionManager.CURRENT_TASK_KEY]
+        if task_data.get("instruction") == instruction:
+            return  # Unchanged, don't mark the session for saving
+        task_data["instruction"] = instruction
         session.modified = True
+        SessionManager._invalidate_task_data()
 
     @staticmethod
     def get_instruction():
@@ -120,16 +263,22 @@ class SessionManager:
     @staticmethod
     def delete_instruction():
         """Delete the instruction from the current task."""
-        if SessionManager.CURRENT_TASK_KEY in session:
-            session[SessionManager.CURRENT_TASK_KEY]["instruction"] = ""
+        task_data = session.get(SessionManager.CURRENT_TASK_KEY)
+        if task_data and task_data.get("instruction"):
+            task_data["instruction"] = ""
             session.modified = True
+            SessionManager._invalidate_task_data()
 
     @staticmethod
     def set_preset_instruction(preset_name):
         """Set the preset instruction for the current task."""
         SessionManager.initialize_task()
-        session[SessionManager.CURRENT_TASK_KEY]["preset_instruction"] = preset_name
+        task_data = session[SessionManager.CURRENT_TASK_KEY]
+        if task_data.get("preset_instruction") == preset_name:
+            return  # Unchanged, don't mark the session for saving
+        task_data["preset_instruction"] = preset_name
         session.modified = True
+        SessionManager._invalidate_task_data()
 
     @staticmethod
     def get_preset_instruction():
@@ -140,9 +289,11 @@ class SessionManager:
     @staticmethod
     def clear_preset_instruction():
         """Clear the preset instruction from the current task."""
-        if SessionManager.CURRENT_TASK_KEY in session:
-            session[SessionManager.CURRENT_TASK_KEY]["preset_instruction"] = ""
+        task_data = session.get(SessionManager.CURRENT_TASK_KEY)
+        if task_data and task_data.get("preset_instruction"):
+            task_data["preset_instruction"] = ""
             session.modified = True
+            SessionManager._invalidate_task_data()
 
     @staticmethod
     def clear_current_task():
@@ -150,6 +301,7 @@ class SessionManager:
         if SessionManager.CURRENT_TASK_KEY in session:
             session.pop(SessionManager.CURRENT_TASK_KEY, None)
             session.modified = True
+            SessionManager._invalidate_task_data()
 
     @staticmethod
     def has_task_data():
@@ -180,7 +332,7 @@ class SessionManager:
 
     @staticmethod
     def save_task(user_folder):
-        """Save the current task to a JSON file and return task ID."""
+        """Save the current task to the task log and return task ID."""
         task_data = SessionManager.get_task_data()
         if not SessionManager.is_task_ready():
             return None
@@ -188,38 +340,24 @@ class SessionManager:
         # Generate unique task ID
         task_id = str(uuid.uuid4())
 
-        # Create task record
+        # Create task record in one pass; articles only hold file metadata, so
+        # the list is shared with the session instead of copied
         task_record = {
+            "title": "",
+            "articles": [],
+            "instruction": "",
+            "preset_instruction": "",
+            **task_data,
             "task_id": task_id,
-            "title": task_data.get("title", ""),
-            "articles": task_data.get("articles", []),
-            "instruction": task_data.get("instruction", ""),
-            "preset_instruction": task_data.get("preset_instruction", ""),
             "status": "pending",  # pending, processing, completed, failed
             "result": "",
-            "created_at": str(uuid.uuid4()),  # Using uuid as timestamp placeholder
+            "created_at": time.time_ns(),  # Epoch nanoseconds
             "user_folder": user_folder,
         }
 
-        # Save to file
-        tasks_file = os.path.join(user_folder, "tasks.json")
-        tasks = []
-
-        # Load existing tasks
-        if os.path.exists(tasks_file):
-            try:
-                with open(tasks_file, "r", encoding="utf-8") as f:
-                    tasks = json.load(f)
-            except:
-                tasks = []
-
-        # Add new task
-        tasks.append(task_record)
-
-        # Save back to file
+        # Append to the task log
         try:
-            with open(tasks_file, "w", encoding="utf-8") as f:
-                json.dump(tasks, f, indent=2, ensure_ascii=False)
+            SessionManager._append_task_records(user_folder, [task_record])
             return task_id
         except Exception as e:
             print(f"Error saving task: {str(e)}")
@@ -228,46 +366,410 @@ class SessionManager:
     @staticmethod
     def get_task_by_id(task_id, user_folder):
         """Get a task by its ID."""
-        tasks_file = os.path.join(user_folder, "tasks.json")
-        if not os.path.exists(tasks_file):
-            return None
-
         try:
-            with open(tasks_file, "r", encoding="utf-8") as f:
-                tasks = json.load(f)
-
-            for task in tasks:
-                if task.get("task_id") == task_id:
-                    return task
+            try:
+                f = open(SessionManager._task_log_path(user_folder), "rb")
+            except FileNotFoundError:
+                # No log yet: tasks, if any, are still in the legacy file,
+                # which the first log write migrates
+                return SessionManager._load_tasks(user_folder).get(task_id)
+
+            # Stat, index and read through the same descriptor, so a
+            # compaction replacing the log can't mix up offsets and files
+            with f:
+                st = os.fstat(f.fileno())
+                task = SessionManager._read_task_cached(f, st, user_folder, task_id)
+            return dict(task) if task is not None else None
         except Exception as e:
             print(f"Error loading task: {str(e)}")
 
         return None
 
+    @staticmethod
+    def _read_task_cached(f, st, user_folder, task_id):
+        """Fold a task from the open log f, reusing it while (inode, size) match."""
+        key = (user_folder, task_id)
+        version = (st.st_ino, st.st_size)  # Changed by any append or compaction
+        with _TASK_CACHE_LOCK:
+            cached = _TASK_CACHE.get(key)
+            if cached is not None and cached[0] == version:
+                _TASK_CACHE.move_to_end(key)
+                return cached[1]
+
+        offsets = SessionManager._task_offsets(f, st, user_folder).get(task_id)
+
+        # Fold only this task's records, read straight from their offsets
+        tasks = {}
+        for offset in offsets or ():
+            f.seek(offset)
+            record = _json_loads(f.readline())
+            SessionManager._apply_task_record(tasks, record)
+
+        task = tasks.get(task_id)
+        # Read-only view so callers can't modify the cached copy
+        task = types.MappingProxyType(task) if task is not None else None
+        with _TASK_CACHE_LOCK:
+            _TASK_CACHE[key] = (version, task)
+            _TASK_CACHE.move_to_end(key)
+            if len(_TASK_CACHE) > SessionManager.TASK_CACHE_SIZE:
+                _TASK_CACHE.popitem(last=False)
+        return task
+
+    @staticmethod
+    def claim_task(task_id, user_folder):
+        """Mark a task as processing unless another request is processing it.
+
+        Returns True if this caller claimed the task, False if the task is
+        missing or already claimed. A stale claim, left behind by a worker
+        that exited mid-task, can be claimed again.
+        """
+        with SessionManager._task_claim_lock(user_folder):
+            task = SessionManager.get_task_by_id(task_id, user_folder)
+            if not task or (
+                task.get("status") == "processing"
+                and not SessionManager.is_claim_stale(task)
+            ):
+                return False
+            return SessionManager.update_task_status(task_id, user_folder, "processing")
+
+    @staticmethod
+    def is_claim_stale(task):
+        """Check whether a processing task has gone unfinished for too long."""
+        if task.get("status") != "processing":
+            return False
+        claimed_at = task.get("claimed_at")
+        if claimed_at is None:
+            return True  # Claimed before claims were timestamped
+        return time.time_ns() - claimed_at > SessionManager.TASK_CLAIM_TIMEOUT * 10**9
+
+    @staticmethod
+    def fail_stale_task(task_id, user_folder):
+        """Mark a task failed if its processing claim is stale.
+
+        Returns True if the task was marked failed, so it can be retried.
+        """
+        with SessionManager._task_claim_lock(user_folder):
+            task = SessionManager.get_task_by_id(task_id, user_folder)
+            if not task or not SessionManager.is_claim_stale(task):
+                return False
+            return SessionManager.update_task_status(
+                task_id,
+                user_folder,
+                "failed",
+                "Processing was interrupted. Please try again.",
+            )
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _task_claim_lock(user_folder):
+        """Serialize task claims across threads and, with fcntl, worker processes."""
+        with _TASK_CLAIM_LOCK:
+            with SessionManager._folder_lock(
+                user_folder, SessionManager.TASK_LOCK_FILENAME
+            ):
+                yield
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _folder_lock(user_folder, lock_filename):
+        """Hold an exclusive flock on a lock file in user_folder, if fcntl exists."""
+        if fcntl is None:
+            yield
+            return
+
+        lock_path = os.path.join(user_folder, lock_filename)
+        with open(lock_path, "ab") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
     @staticmethod
     def update_task_status(task_id, user_folder, status, result=None):
         """Update task status and result."""
-        tasks_file = os.path.join(user_folder, "tasks.json")
-        if not os.path.exists(tasks_file):
-            return False
+        return SessionManager.update_task_status_batch(
+            user_folder, [(task_id, status, result)]
+        )
 
-        try:
-            with open(tasks_file, "r", encoding="utf-8") as f:
-                tasks = json.load(f)
-
-            # Find and update the task
-            for task in tasks:
-                if task.get("task_id") == task_id:
-                    task["status"] = status
-                    if result is not None:
-                        task["result"] = result
-                    break
+    @staticmethod
+    def update_task_status_batch(user_folder, updates):
+        """Apply several (task_id, status, result) updates with a single write."""
+        if not (
+            os.path.exists(SessionManager._task_log_path(user_folder))
+            or os.path.exists(SessionManager._legacy_tasks_path(user_folder))
+        ):
+            return False
 
-            # Save back to file
-            with open(tasks_file, "w", encoding="utf-8") as f:
-                json.dump(tasks, f, indent=2, ensure_ascii=False)
+        # Record the changes; readers fold them into the tasks on load
+        update_records = []
+        for task_id, status, result in updates:
+            update_record = {"task_id": task_id, "op": "update", "status": status}
+            if result is not None:
+                update_record["result"] = result
+            if status == "processing":
+                update_record["claimed_at"] = time.time_ns()
+            update_records.append(update_record)
 
+        try:
+            SessionManager._append_task_records(user_folder, update_records)
             return True
         except Exception as e:
             print(f"Error updating task: {str(e)}")
             return False
+
+    @staticmethod
+    def _task_log_path(user_folder):
+        """Path of the append-only task log for a user folder."""
+        return os.path.join(user_folder, SessionManager.TASK_LOG_FILENAME)
+
+    @staticmethod
+    def _legacy_tasks_path(user_folder):
+        """Path of the pre-log tasks.json file for a user folder."""
+        return os.path.join(user_folder, SessionManager.LEGACY_TASKS_FILENAME)
+
+    @staticmethod
+    def _encode_task_records(records):
+        """Encode records as JSON lines."""
+        return b"".join(_json_dumps(record) + b"\n" for record in records)
+
+    @staticmethod
+    def _append_task_records(user_folder, records):
+        """Append records to the task log through the shared batching writer."""
+        _task_writer.append(user_folder, records)
+
+    @staticmethod
+    def _write_task_records(user_folder, records):
+        """Write records to the task log, compacting it when it grows large."""
+        data = SessionManager._encode_task_records(records)
+
+        # Other worker processes append and compact the same log
+        with SessionManager._folder_lock(
+            user_folder, SessionManager.TASK_WRITE_LOCK_FILENAME
+        ):
+            log_path = SessionManager._task_log_path(user_folder)
+            # One O_APPEND write per batch, without a buffered file object
+            fd = os.open(log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view) :]
+                st = os.fstat(fd)
+            finally:
+                os.close(fd)
+            log_size = st.st_size
+
+            # Measure growth from the last compaction; a log created or compacted
+            # by another process is measured from its size before this write
+            baseline = _TASK_LOG_BASELINE.get(user_folder)
+            if baseline is None or baseline[0] != st.st_ino:
+                baseline = (st.st_ino, log_size - len(data))
+                _TASK_LOG_BASELINE[user_folder] = baseline
+            compact_size = max(
+                SessionManager.TASK_LOG_COMPACT_BYTES,
+                SessionManager.TASK_LOG_GROWTH_FACTOR * baseline[1],
+            )
+
+            # A legacy tasks.json can only exist alongside a log we just created
+            if log_size > compact_size or (
+                log_size == len(data)
+                and os.path.exists(SessionManager._legacy_tasks_path(user_folder))
+            ):
+                SessionManager._compact_task_log(user_folder)
+
+    @staticmethod
+    def _load_tasks(user_folder):
+        """Replay the task log into a {task_id: task} dict in creation order."""
+        tasks = {}
+
+        # Tasks saved before the log existed are migrated on next compaction
+        legacy_path = SessionManager._legacy_tasks_path(user_folder)
+        try:
+            with open(legacy_path, "rb") as f:
+                for task in _json_loads(f.read()):
+                    tasks[task.get("task_id")] = task
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Error loading legacy tasks: {str(e)}")
+
+        log_path = SessionManager._task_log_path(user_folder)
+        try:
+            with open(log_path, "rb") as f:
+                for line in f:
+                    try:
+                        record = _json_loads(line)
+                    except ValueError:
+                        continue  # Skip blank or partially written lines
+                    SessionManager._apply_task_record(tasks, record)
+        except FileNotFoundError:
+            pass
+
+        return tasks
+
+    @staticmethod
+    def _task_offsets(f, st, user_folder):
+        """Return {task_id: [record offsets]} for the open task log f.
+
+        st is the fstat of f; the index is kept up to date across calls.
+        """
+        with _TASK_INDEX_LOCK:
+            index = _TASK_INDEX.get(user_folder)
+
+            # Compaction replaces the file; anything but growth means rebuild
+            if index is None or index["ino"] != st.st_ino or st.st_size < index["size"]:
+                index = {"ino": st.st_ino, "size": 0, "offsets": {}}
+                _TASK_INDEX[user_folder] = index
+
+            # The log is append-only, so only index lines added since last time
+            if st.st_size > index["size"]:
+                offsets = index["offsets"]
+                offset = index["size"]
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # Line still being written; index it later
+                    try:
+                        task_id = _json_loads(line).get("task_id")
+                        offsets.setdefault(task_id, []).append(offset)
+                    except ValueError:
+                        pass
+                    offset += len(line)
+                index["size"] = offset
+
+            return index["offsets"]
+
+    @staticmethod
+    def _apply_task_record(tasks, record):
+        """Fold a single log record into the tasks dict."""
+        task_id = record.get("task_id")
+        if record.get("op") == "update":
+            task = tasks.get(task_id)
+            if task is not None:
+                task["status"] = record.get("status")
+                if "result" in record:
+                    task["result"] = record["result"]
+                if "claimed_at" in record:
+                    task["claimed_at"] = record["claimed_at"]
+        else:
+            tasks[task_id] = record
+
+    @staticmethod
+    def _compact_task_log(user_folder):
+        """Rewrite the task log with one record per task.
+
+        Callers must hold the task log write lock.
+        """
+        tasks = SessionManager._load_tasks(user_folder)
+        log_path = SessionManager._task_log_path(user_folder)
+        tmp_path = f"{log_path}.{uuid.uuid4().hex}.tmp"
+
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(SessionManager._encode_task_records(tasks.values()))
+            os.replace(tmp_path, log_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        st = os.stat(log_path)
+        _TASK_LOG_BASELINE[user_folder] = (st.st_ino, st.st_size)
+
+        # Legacy tasks are now part of the log
+        try:
+            os.remove(SessionManager._legacy_tasks_path(user_folder))
+        except FileNotFoundError:
+            pass
+
+
+class _TaskWriter:
+    """Group-commits task log appends from a single background thread.
+
+    Callers block until their records are written, so a task is readable as
+    soon as save_task returns, even from another worker process. Appends that
+    queue up while a write is in progress are combined into one write() per
+    user folder. Logs are only fsynced on flush_all (registered at exit).
+    """
+
+    MAX_BATCH = 128  # Most appends combined into one write pass
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        """Start from a fresh queue and no thread, e.g. in a forked worker.
+
+        A queue inherited across fork still lists the parent's writer thread
+        as its waiter, so new appends would never wake this process's writer.
+        """
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._unsynced = set()  # Log paths written since the last fsync
+
+    def append(self, user_folder, records):
+        """Queue records for user_folder and wait until they are written."""
+        pending = {"user_folder": user_folder, "records": records, "error": None}
+        pending["done"] = threading.Event()
+        self._ensure_thread()
+        self._queue.put(pending)
+        pending["done"].wait()
+        if pending["error"] is not None:
+            raise pending["error"]
+
+    def flush_all(self):
+        """fsync every task log written since the last flush."""
+        with self._lock:
+            log_paths, self._unsynced = self._unsynced, set()
+        for log_path in log_paths:
+            try:
+                with open(log_path, "rb") as f:
+                    os.fsync(f.fileno())
+            except FileNotFoundError:
+                pass  # Folder removed since; nothing left to sync
+            except OSError as e:
+                print(f"Error syncing task log: {str(e)}")
+
+    def _ensure_thread(self):
+        """Start the writer thread on first use (after any worker fork)."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="task-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            # Block for the first append, then take whatever else is queued
+            batch = [self._queue.get()]
+            while len(batch) < self.MAX_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            by_folder = {}
+            for pending in batch:
+                by_folder.setdefault(pending["user_folder"], []).append(pending)
+
+            for user_folder, pendings in by_folder.items():
+                records = [r for pending in pendings for r in pending["records"]]
+                try:
+                    SessionManager._write_task_records(user_folder, records)
+                    with self._lock:
+                        self._unsynced.add(SessionManager._task_log_path(user_folder))
+                except Exception as e:
+                    for pending in pendings:
+                        pending["error"] = e
+                for pending in pendings:
+                    pending["done"].set()
+
+
+_task_writer = _TaskWriter()
+atexit.register(_task_writer.flush_all)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_task_writer._reset)
@@ -3,13 +3,29 @@ Flask blueprint for task-related endpoints.
 Handles task creation, article management, and related functionality.
 """
 
+import functools
+import json
 import os
-from flask import Blueprint, render_template, request, session, redirect, url_for, flash
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from flask import (
+    Blueprint,
+    Response,
+    abort,
+    current_app,
+    render_template,
+    request,
+    session,
+    redirect,
+    url_for,
+    flash,
+    jsonify,
+)
 from .session_manager import SessionManager
 from .util import (
     allowed_file,
     get_user_folder,
-    get_next_input_number,
     save_text_article,
     save_pdf_article,
     remove_article_with_cleanup,
@@ -21,6 +37,106 @@ from .util import (
 
 bp = Blueprint("task", __name__, url_prefix="/task")
 
+# Always use the default prompt template file
+PROMPT_FILE_PATH = os.path.join(
+    os.path.dirname(__file__), "gemini", "prompts", "prompt.txt"
+)
+
+# Background workers that run Gemini calls off the request thread
+TASK_WORKERS = 4
+_pool = ThreadPoolExecutor(max_workers=TASK_WORKERS, thread_name_prefix="task")
+# Unfinished futures -> (task_id, user_folder, chunks), so tasks the worker
+# process can't finish before it exits can be marked failed
+_submitted = {}
+_submitted_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def _get_client():
+    """Return the Gemini client, created once per process and then reused."""
+    # Imported lazily: the Gemini SDK is only needed when a task is processed
+    from .gemini.rewriting_client import RewritingClient
+
+    return RewritingClient()
+
+
+def _run_task(task_id, user_folder, preset_id, chunks=None):
+    """Process a claimed task in the background and record the outcome.
+
+    If chunks is a queue, generated text is also put on it as it arrives,
+    followed by None once the outcome has been recorded.
+    """
+    try:
+        client = _get_client()
+        parts = []
+        for text in client.stream_task(
+            user_folder, PROMPT_FILE_PATH, preset_id or None
+        ):
+            parts.append(text)
+            if chunks is not None:
+                chunks.put(text)
+
+        # Update status to completed with result
+        SessionManager.update_task_status(
+            task_id, user_folder, "completed", "".join(parts)
+        )
+    except Exception as e:
+        # Update status to failed
+        SessionManager.update_task_status(task_id, user_folder, "failed", str(e))
+        if chunks is not None:
+            chunks.put(f"\n\n{str(e)}")
+    finally:
+        if chunks is not None:
+            chunks.put(None)
+
+
+def _submit_task(task_id, user_folder, preset_id, chunks=None):
+    """Queue a claimed task on the background pool."""
+    future = _pool.submit(_run_task, task_id, user_folder, preset_id, chunks)
+    with _submitted_lock:
+        _submitted[future] = (task_id, user_folder, chunks)
+    future.add_done_callback(_forget_task)
+    return future
+
+
+def _forget_task(future):
+    """Stop tracking a task once its future has finished."""
+    with _submitted_lock:
+        _submitted.pop(future, None)
+
+
+def shutdown_task_pool(timeout=0):
+    """Stop the task pool, marking tasks it can't finish as failed.
+
+    Called when a worker process exits (see gunicorn.conf.py). Queued tasks
+    are cancelled; running ones get up to timeout seconds to finish. Any
+    left are marked failed so they can be retried right away, since the
+    process may be killed before they finish.
+    """
+    with _submitted_lock:
+        submitted = list(_submitted.items())
+    _pool.shutdown(wait=False, cancel_futures=True)
+    wait([future for future, _ in submitted], timeout=timeout)
+
+    message = "Processing was interrupted by a server restart. Please try again."
+    for future, (task_id, user_folder, chunks) in submitted:
+        if future.done() and not future.cancelled():
+            continue  # Finished and recorded its own outcome
+        SessionManager.update_task_status(task_id, user_folder, "failed", message)
+        if chunks is not None:
+            # End any stream still waiting on this task
+            chunks.put(message)
+            chunks.put(None)
+
+
+def _get_task_or_fail_stale(task_id, user_folder):
+    """Load a task, first failing it if its processing claim has gone stale."""
+    task = SessionManager.get_task_by_id(task_id, user_folder)
+    if task and SessionManager.is_claim_stale(task):
+        if SessionManager.fail_stale_task(task_id, user_folder):
+            task = SessionManager.get_task_by_id(task_id, user_folder)
+    return task
+
 
 @bp.route("/new", methods=["GET", "POST"])
 def new_task():
@@ -90,12 +206,11 @@ def add_article():
         SessionManager.initialize_task()
 
         input_type = request.form.get("input_type")
-        article_data = None
+        articles = []
         error_message = None
 
-        # Get user folder and next input number
+        # Get user folder; input numbers are reserved only for valid input
         user_folder = get_user_folder()
-        input_number = get_next_input_number(user_folder)
 
         if input_type == "text":
             # Handle text input - save as text file
@@ -106,40 +221,51 @@ def add_article():
                 return render_template("add_article.html")
 
             # Save text to file
+            input_number = SessionManager.get_and_increment_input_counter(user_folder)
             article_data, error_message = save_text_article(
                 article_content, user_folder, input_number
             )
+            if article_data:
+                articles.append(article_data)
 
         elif input_type == "pdf":
-            # Handle PDF upload
-            if "pdf_file" not in request.files:
+            # Handle PDF upload, one or more files at once
+            files = [f for f in request.files.getlist("pdf_file") if f.filename]
+            if not files:
                 flash("No PDF file selected.", "error")
                 return render_template("add_article.html")
 
-            file = request.files["pdf_file"]
-            if file.filename == "":
-                flash("No PDF file selected.", "error")
+            if not all(allowed_file(f.filename) for f in files):
+                flash("Please upload a valid PDF file.", "error")
                 return render_template("add_article.html")
 
-            if file and allowed_file(file.filename):
+            for file in files:
                 # Save the PDF file with sequential naming
+                input_number = SessionManager.get_and_increment_input_counter(
+                    user_folder
+                )
                 article_data, error_message = save_pdf_article(
                     file, user_folder, input_number
                 )
-            else:
-                flash("Please upload a valid PDF file.", "error")
-                return render_template("add_article.html")
+                if error_message:
+                    break
+                articles.append(article_data)
+
+        # Add everything saved in one session update, even if a later file failed
+        if articles:
+            SessionManager.add_articles(articles)
 
         # Handle results
         if error_message:
             flash(error_message, "error")
             return render_template("add_article.html")
 
-        if article_data:
-            SessionManager.add_article(article_data)
-            flash(
-                f"Article added successfully as {article_data['filename']}!", "success"
-            )
+        if articles:
+            filenames = ", ".join(article.filename for article in articles)
+            if len(articles) == 1:
+                flash(f"Article added successfully as {filenames}!", "success")
+            else:
+                flash(f"Articles added successfully as {filenames}!", "success")
             return redirect(url_for("task.new_task"))
 
     return render_template("add_article.html")
@@ -239,7 +365,7 @@ def add_instruction():
 def view_task(task_id):
     """View a specific task."""
     user_folder = get_user_folder()
-    task = SessionManager.get_task_by_id(task_id, user_folder)
+    task = _get_task_or_fail_stale(task_id, user_folder)
 
     if not task:
         flash("Task not found.", "error")
@@ -248,6 +374,34 @@ def view_task(task_id):
     return render_template("view_task.html", task=task)
 
 
+@bp.route("/debug/<task_id>")
+def debug_task(task_id):
+    """Pretty-print a stored task record (debug mode only)."""
+    if not current_app.debug:
+        abort(404)
+
+    user_folder = get_user_folder()
+    task = SessionManager.get_task_by_id(task_id, user_folder)
+    if not task:
+        abort(404)
+
+    return Response(
+        json.dumps(task, indent=2, ensure_ascii=False), mimetype="application/json"
+    )
+
+
+@bp.route("/status/<task_id>")
+def task_status(task_id):
+    """Return the status of a task as JSON, for polling."""
+    user_folder = get_user_folder()
+    task = _get_task_or_fail_stale(task_id, user_folder)
+
+    if not task:
+        return jsonify(error="Task not found."), 404
+
+    return jsonify(task_id=task_id, status=task.get("status"))
+
+
 @bp.route("/process/<task_id>", methods=["POST"])
 def process_task(task_id):
     """Process a task using Gemini AI."""
@@ -258,37 +412,53 @@ def process_task(task_id):
         flash("Task not found.", "error")
         return redirect(url_for("task.new_task"))
 
-    if task.get("status") == "processing":
+    # Claim the task so concurrent submits don't process it twice
+    if not SessionManager.claim_task(task_id, user_folder):
         flash("Task is already being processed.", "info")
         return redirect(url_for("task.view_task", task_id=task_id))
 
+    # Hand the Gemini call to a background worker; the task page polls
+    # /task/status/<task_id> until it finishes
+    preset_id = task.get("preset_instruction", "")
     try:
-        # Update status to processing
-        SessionManager.update_task_status(task_id, user_folder, "processing")
-
-        # Import and use Gemini client
-        from .gemini.rewriting_client import RewritingClient
+        _submit_task(task_id, user_folder, preset_id)
+        flash("Task queued for processing.", "info")
+    except RuntimeError as e:
+        # Pool already shut down (interpreter exiting)
+        SessionManager.update_task_status(task_id, user_folder, "failed", str(e))
+        flash(f"Error processing task: {str(e)}", "error")
 
-        # Always use the default prompt template file
-        prompt_file_path = os.path.join(
-            os.path.dirname(__file__), "gemini", "prompts", "prompt.txt"
-        )
+    return redirect(url_for("task.view_task", task_id=task_id))
 
-        # Get preset ID if task uses preset instruction
-        preset_id = task.get("preset_instruction", "")
 
-        # Initialize client and process
-        client = RewritingClient()
-        result = client.process_task(user_folder, prompt_file_path, preset_id or None)
+@bp.route("/stream/<task_id>", methods=["POST"])
+def stream_task(task_id):
+    """Process a task using Gemini AI, streaming the result as it is generated."""
+    user_folder = get_user_folder()
+    task = SessionManager.get_task_by_id(task_id, user_folder)
 
-        # Update status to completed with result
-        SessionManager.update_task_status(task_id, user_folder, "completed", result)
+    if not task:
+        return Response("Task not found.", status=404, mimetype="text/plain")
 
-        flash("Task processed successfully!", "success")
+    # Claim the task so concurrent submits don't process it twice
+    if not SessionManager.claim_task(task_id, user_folder):
+        return Response(
+            "Task is already being processed.", status=409, mimetype="text/plain"
+        )
 
-    except Exception as e:
-        # Update status to failed
+    # Run the Gemini call on the task pool, like /process, and relay its
+    # output; if the client disconnects the task still runs to completion
+    preset_id = task.get("preset_instruction", "")
+    chunks = queue.Queue()
+    try:
+        _submit_task(task_id, user_folder, preset_id, chunks)
+    except RuntimeError as e:
+        # Pool already shut down (interpreter exiting)
         SessionManager.update_task_status(task_id, user_folder, "failed", str(e))
-        flash(f"Error processing task: {str(e)}", "error")
+        return Response(str(e), status=503, mimetype="text/plain")
 
-    return redirect(url_for("task.view_task", task_id=task_id))
+    def generate():
+        for text in iter(chunks.get, None):
+            yield text
+
+    return Response(generate(), mimetype="text/plain")
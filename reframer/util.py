@@ -3,93 +3,251 @@ Utility functions for the rewriter application.
 Contains file handling and other helper functions.
 """
 
+import dataclasses
+import functools
 import os
-import uuid
+import pathlib
+import re
+import secrets
+import shutil
+import tempfile
+import threading
+from flask import Request, g
 from .session_manager import SessionManager
 
 # Configuration for file uploads
 UPLOAD_FOLDER = "instance/uploads"
-ALLOWED_EXTENSIONS = {"pdf", "txt"}
+ALLOWED_EXTENSIONS = frozenset(("pdf", "txt"))
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1MB copy buffer for uploaded files
+PREVIEW_LENGTH = 50  # Characters of article text shown in the task summary
+
+# MIME types of saved articles, fixed by the save function used
+MIME_TEXT = "text/plain; charset=utf-8"
+MIME_PDF = "application/pdf"
+
+# Not defined on Windows, where handles aren't inherited by default
+_O_CLOEXEC = getattr(os, "O_CLOEXEC", 0)
+
+# Article files are saved as input<N>.txt / input<N>.pdf
+INPUT_FILE_RE = re.compile(r"^input(\d+)\.(?:txt|pdf)$")
+
+# Prompt files ship with the app and only change on deploy
+PROMPTS_FOLDER = os.path.join(os.path.dirname(__file__), "gemini", "prompts")
+# {"mtime_ns": int, "presets": list, "files": {name: path}}; the list and
+# dict are replaced on rescan, never changed in place
+_PRESETS_CACHE = {}
+_PRESETS_LOCK = threading.Lock()
+
+
+@dataclasses.dataclass(slots=True)
+class ArticleData:
+    """Metadata for an article saved in the user folder."""
+
+    id: str
+    type: str
+    file_path: str
+    filename: str
+    source: str
+    preview: str
+    mime: str
+
+
+class UploadRequest(Request):
+    """Request that spools uploaded files inside the uploads folder.
+
+    Werkzeug buffers file parts in memory and then in a temporary file under
+    /tmp, which ``save()`` copies again into the user folder. Spooling onto
+    the same filesystem as the final destination lets ``save_pdf_article``
+    link the spool file into place instead of copying it.
+    """
+
+    def _get_file_stream(
+        self, total_content_length, content_type, filename=None, content_length=None
+    ):
+        try:
+            return tempfile.NamedTemporaryFile("wb+", dir=UPLOAD_FOLDER, suffix=".part")
+        except FileNotFoundError:
+            # Create the uploads folder on first use, then spool as usual
+            os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+            return tempfile.NamedTemporaryFile("wb+", dir=UPLOAD_FOLDER, suffix=".part")
 
 
 def allowed_file(filename):
     """Check if the uploaded file has an allowed extension."""
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+    _, dot, extension = filename.rpartition(".")
+    return bool(dot) and extension.lower() in ALLOWED_EXTENSIONS
 
 
 def get_user_folder():
     """Get or create user folder based on session."""
-    user_id = SessionManager.get_user_id()
-    user_folder = os.path.join(UPLOAD_FOLDER, user_id)
-    os.makedirs(user_folder, exist_ok=True)
+    # Resolved at most once per request
+    user_folder = g.get("user_folder")
+    if user_folder is None:
+        # A cached folder costs one stat per request instead of a mkdir, and
+        # is recreated if it was cleaned up on disk since it was cached
+        user_folder = SessionManager.get_cached_user_folder()
+        if user_folder is None or not os.path.isdir(user_folder):
+            user_id = SessionManager.get_user_id()
+            user_folder = os.path.join(UPLOAD_FOLDER, user_id)
+            try:
+                os.mkdir(user_folder)
+            except FileExistsError:
+                pass
+            except FileNotFoundError:
+                # The uploads folder itself is missing
+                os.makedirs(user_folder, exist_ok=True)
+            SessionManager.set_cached_user_folder(user_folder)
+        g.user_folder = user_folder
     return user_folder
 
 
 def get_next_input_number(user_folder):
     """Get the next sequential input number for this user."""
-    existing_files = [
-        f
-        for f in os.listdir(user_folder)
-        if f.startswith("input") and (f.endswith(".pdf") or f.endswith(".txt"))
-    ]
-    if not existing_files:
-        return 1
-
-    numbers = []
-    for filename in existing_files:
+    highest = 0
+    match_input_file = INPUT_FILE_RE.match  # Bound once for the loop
+    try:
+        entries = os.scandir(user_folder)
+    except FileNotFoundError:
+        return 1  # Folder removed on disk, so there are no input files yet
+    with entries:
+        for entry in entries:
+            match = match_input_file(entry.name)
+            if match and entry.is_file():
+                number = int(match.group(1))
+                if number > highest:
+                    highest = number
+
+    return highest + 1
+
+
+def write_file_bytes(file_path, data):
+    """Atomically replace file_path with data, using raw fd writes."""
+    # Written to a unique temp file first so readers never see a partial file
+    tmp_path = f"{file_path}.{secrets.token_hex(4)}.tmp"
+    # Owner-only, like the spooled uploads, and never inherited by children
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | _O_CLOEXEC
+    fd = os.open(tmp_path, flags, 0o600)
+    try:
         try:
-            # Remove 'input' and file extension to get the number
-            name_without_ext = filename.replace("input", "").split(".")[0]
-            num = int(name_without_ext)
-            numbers.append(num)
-        except ValueError:
-            continue
-
-    return max(numbers) + 1 if numbers else 1
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view) :]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
 
 
 def save_text_article(article_content, user_folder, input_number):
     """Save text content to a file and return article data."""
     filename = f"input{input_number}.txt"
-    file_path = os.path.join(user_folder, filename)
+    # Resolved once here so removal can unlink the stored path directly
+    file_path = os.path.abspath(os.path.join(user_folder, filename))
 
     try:
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(article_content)
-
-        article_data = {
-            "id": str(uuid.uuid4()),
-            "type": "text",
-            "file_path": file_path,
-            "filename": filename,
-            "source": "Text Input",
-            "preview": (
-                article_content[:50] + "..."
-                if len(article_content) > 50
+        write_file_bytes(file_path, article_content.encode("utf-8"))
+
+        article_data = ArticleData(
+            id=secrets.token_hex(16),
+            type="text",
+            file_path=file_path,
+            filename=filename,
+            source="Text Input",
+            preview=(
+                f"{article_content[:PREVIEW_LENGTH]}..."
+                if len(article_content) > PREVIEW_LENGTH
                 else article_content
             ),
-        }
+            mime=MIME_TEXT,
+        )
         return article_data, None  # article_data, error
     except Exception as e:
         return None, f"Error saving text file: {str(e)}"
 
 
+def store_uploaded_file(uploaded_file, file_path):
+    """Move an uploaded file to file_path without buffering it in memory."""
+    stream = uploaded_file.stream
+    spool_path = getattr(stream, "name", None)
+
+    # Spooled by UploadRequest: the data is already on disk next to the target
+    if isinstance(spool_path, str):
+        stream.flush()
+        try:
+            os.link(spool_path, file_path)
+            return
+        except OSError:
+            stream.seek(0)  # Cross-device or existing target, copy instead
+
+    # Unbuffered: the copy already moves data in UPLOAD_CHUNK_SIZE blocks
+    with open(file_path, "wb", buffering=0) as dst:
+        copy_stream_to_file(stream, dst)
+
+
+def copy_stream_to_file(stream, dst):
+    """Copy stream into dst, in the kernel with sendfile when possible."""
+    if hasattr(os, "sendfile"):
+        try:
+            src_fd = stream.fileno()
+        except (AttributeError, OSError, ValueError):
+            src_fd = None  # In-memory stream
+
+        if src_fd is not None:
+            start = offset = stream.tell()
+            try:
+                while True:
+                    sent = os.sendfile(dst.fileno(), src_fd, offset, UPLOAD_CHUNK_SIZE)
+                    if not sent:
+                        return
+                    offset += sent
+            except OSError:
+                # Unsupported for these files, start over in user space
+                stream.seek(start)
+                dst.seek(0)
+                dst.truncate()
+
+    shutil.copyfileobj(stream, dst, UPLOAD_CHUNK_SIZE)
+
+
+def drop_file_cache(file_path):
+    """Advise the kernel that file_path's cached pages won't be read again."""
+    if not hasattr(os, "posix_fadvise"):
+        return  # Not available on Windows or macOS
+
+    try:
+        fd = os.open(file_path, os.O_RDONLY | _O_CLOEXEC)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass  # Only a hint
+
+
 def save_pdf_article(uploaded_file, user_folder, input_number):
     """Save uploaded PDF file and return article data."""
     filename = f"input{input_number}.pdf"
-    file_path = os.path.join(user_folder, filename)
+    # Resolved once here so removal can unlink the stored path directly
+    file_path = os.path.abspath(os.path.join(user_folder, filename))
 
     try:
-        uploaded_file.save(file_path)
-
-        article_data = {
-            "id": str(uuid.uuid4()),
-            "type": "pdf",
-            "file_path": file_path,
-            "filename": filename,
-            "source": "PDF Upload",
-            "preview": f"PDF file: {filename}",
-        }
+        store_uploaded_file(uploaded_file, file_path)
+
+        article_data = ArticleData(
+            id=secrets.token_hex(16),
+            type="pdf",
+            file_path=file_path,
+            filename=filename,
+            source="PDF Upload",
+            preview=f"PDF file: {filename}",
+            mime=MIME_PDF,
+        )
         return article_data, None  # article_data, error
     except Exception as e:
         return None, f"Error saving PDF file: {str(e)}"
@@ -98,12 +256,10 @@ def save_pdf_article(uploaded_file, user_folder, input_number):
 def delete_article_file(file_path):
     """Delete an article file from the filesystem."""
     try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            return True
+        os.unlink(file_path)
+        return True
     except OSError:
-        pass  # File might not exist or already deleted
-    return False
+        return False  # File might not exist or already deleted
 
 
 def remove_article_with_cleanup(article_id):
@@ -111,6 +267,9 @@ def remove_article_with_cleanup(article_id):
     removed_article = SessionManager.remove_article(article_id)
     if removed_article and removed_article.get("file_path"):
         delete_article_file(removed_article["file_path"])
+        match = INPUT_FILE_RE.match(removed_article.get("filename", ""))
+        if match:
+            SessionManager.release_input_number(int(match.group(1)))
         return True
     return False
 
@@ -121,8 +280,7 @@ def save_instruction_file(instruction_content, user_folder):
     file_path = os.path.join(user_folder, filename)
 
     try:
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(instruction_content)
+        write_file_bytes(file_path, instruction_content.encode("utf-8"))
         return file_path, None  # file_path, error
     except Exception as e:
         return None, f"Error saving instruction file: {str(e)}"
@@ -134,73 +292,115 @@ def delete_instruction_file(user_folder):
     file_path = os.path.join(user_folder, filename)
 
     try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            return True
+        os.unlink(file_path)
+        return True
     except OSError:
-        pass  # File might not exist or already deleted
-    return False
+        return False  # File might not exist or already deleted
+
+
+@functools.lru_cache(maxsize=32)
+def _read_prompt_file(file_path, mtime_ns):
+    """Read and strip a prompt file; mtime_ns only keys the cache."""
+    return pathlib.Path(file_path).read_bytes().decode("utf-8").strip()
+
+
+def read_prompt_file(file_path):
+    """Read a prompt file, reusing the cached content while it is unchanged."""
+    return _read_prompt_file(file_path, os.stat(file_path).st_mtime_ns)
+
+
+def _get_preset_cache():
+    """Return (presets, files), rescanning the prompts folder if it changed."""
+    try:
+        mtime_ns = os.stat(PROMPTS_FOLDER).st_mtime_ns
+    except OSError:
+        return [], {}
+
+    # Reuse the scan until a file is added, removed or replaced
+    with _PRESETS_LOCK:
+        if _PRESETS_CACHE.get("mtime_ns") != mtime_ns:
+            presets = _load_preset_instructions()
+            files = {
+                preset["name"]: os.path.join(PROMPTS_FOLDER, preset["filename"])
+                for preset in presets
+            }
+            _PRESETS_CACHE.update(mtime_ns=mtime_ns, presets=presets, files=files)
+        return _PRESETS_CACHE["presets"], _PRESETS_CACHE["files"]
 
 
 def get_preset_instructions():
     """Get available preset instructions from the prompts folder."""
-    prompts_folder = os.path.join(os.path.dirname(__file__), "gemini", "prompts")
+    presets, files = _get_preset_cache()
+
+    # Files edited in place don't change the folder mtime, so return copies
+    # with their content read through the per-file cache
+    refreshed = []
+    for preset in presets:
+        try:
+            content = read_prompt_file(files[preset["name"]])
+        except OSError:
+            content = preset["content"]
+        refreshed.append({**preset, "content": content})
+    return refreshed
+
+
+def _load_preset_instructions():
+    """Scan the prompts folder and build the sorted preset list."""
     presets = []
 
-    if os.path.exists(prompts_folder):
-        for filename in os.listdir(prompts_folder):
+    if os.path.exists(PROMPTS_FOLDER):
+        for filename in os.listdir(PROMPTS_FOLDER):
             if filename.startswith("preset_") and filename.endswith(".txt"):
                 preset_name = filename[
                     7:-4
                 ]  # Remove "preset_" prefix and ".txt" suffix
-                preset_file = os.path.join(prompts_folder, filename)
+                preset_file = os.path.join(PROMPTS_FOLDER, filename)
 
                 try:
-                    with open(preset_file, "r", encoding="utf-8") as f:
-                        content = f.read().strip()
-
-                        # Define custom titles and descriptions for each preset
-                        preset_info = {
-                            "news": {
-                                "title": "News/Journalism Style",
-                                "description": "Professional news writing with objective reporting, inverted pyramid structure, and journalistic standards",
-                            },
-                            "academic": {
-                                "title": "Academic Writing Style",
-                                "description": "Formal scholarly tone with citations, complex structure, and analytical approach",
-                            },
-                            "casual": {
-                                "title": "Casual/Conversational Style",
-                                "description": "Friendly, approachable writing with simple language and personal tone",
-                            },
-                            "pro_trump": {
-                                "title": "Pro-Trump Perspective",
-                                "description": "Supportive viewpoint emphasizing achievements, strength themes, and America First messaging",
-                            },
-                            "con_trump": {
-                                "title": "Anti-Trump Perspective",
-                                "description": "Critical viewpoint focusing on accountability, democratic concerns, and institutional impacts",
-                            },
+                    content = read_prompt_file(preset_file)
+
+                    # Define custom titles and descriptions for each preset
+                    preset_info = {
+                        "news": {
+                            "title": "News/Journalism Style",
+                            "description": "Professional news writing with objective reporting, inverted pyramid structure, and journalistic standards",
+                        },
+                        "academic": {
+                            "title": "Academic Writing Style",
+                            "description": "Formal scholarly tone with citations, complex structure, and analytical approach",
+                        },
+                        "casual": {
+                            "title": "Casual/Conversational Style",
+                            "description": "Friendly, approachable writing with simple language and personal tone",
+                        },
+                        "pro_trump": {
+                            "title": "Pro-Trump Perspective",
+                            "description": "Supportive viewpoint emphasizing achievements, strength themes, and America First messaging",
+                        },
+                        "con_trump": {
+                            "title": "Anti-Trump Perspective",
+                            "description": "Critical viewpoint focusing on accountability, democratic concerns, and institutional impacts",
+                        },
+                    }
+
+                    # Get preset-specific info or use defaults
+                    info = preset_info.get(
+                        preset_name,
+                        {
+                            "title": f"Preset {preset_name.replace('_', ' ').title()}",
+                            "description": f"Rewriting style preset {preset_name}",
+                        },
+                    )
+
+                    presets.append(
+                        {
+                            "name": preset_name,
+                            "filename": filename,
+                            "title": info["title"],
+                            "description": info["description"],
+                            "content": content,
                         }
-
-                        # Get preset-specific info or use defaults
-                        info = preset_info.get(
-                            preset_name,
-                            {
-                                "title": f"Preset {preset_name.replace('_', ' ').title()}",
-                                "description": f"Rewriting style preset {preset_name}",
-                            },
-                        )
-
-                        presets.append(
-                            {
-                                "name": preset_name,
-                                "filename": filename,
-                                "title": info["title"],
-                                "description": info["description"],
-                                "content": content,
-                            }
-                        )
+                    )
                 except Exception as e:
                     print(f"Error reading preset {filename}: {str(e)}")
 
@@ -222,15 +422,13 @@ def get_preset_instructions():
 
 def get_preset_content(preset_name):
     """Get the content of a specific preset instruction."""
-    preset_file = os.path.join(
-        os.path.dirname(__file__), "gemini", "prompts", f"preset_{preset_name}.txt"
-    )
+    # Only known names map to a file, so preset_name can't escape the folder
+    preset_file = _get_preset_cache()[1].get(preset_name)
+    if preset_file is None:
+        return ""
 
+    # Keyed on the file's own mtime, so in-place edits are picked up
     try:
-        if os.path.exists(preset_file):
-            with open(preset_file, "r", encoding="utf-8") as f:
-                return f.read().strip()
-    except Exception as e:
-        print(f"Error reading preset {preset_name}: {str(e)}")
-
-    return ""
+        return read_prompt_file(preset_file)
+    except OSError:
+        return ""
@@ -0,0 +1,75 @@
+"""
+Tests for preset instruction loading in util.
+Run from the repository root with: python -m unittest
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from reframer import util
+
+
+class PresetContentTest(unittest.TestCase):
+    """Preset content follows edits made to the preset files."""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        for patcher in (
+            mock.patch.object(util, "PROMPTS_FOLDER", self._tmp.name),
+            mock.patch.dict(util._PRESETS_CACHE, clear=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write_preset(self, name, content, mtime_ns):
+        preset_file = os.path.join(self._tmp.name, f"preset_{name}.txt")
+        with open(preset_file, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.utime(preset_file, ns=(mtime_ns, mtime_ns))
+
+    def test_in_place_edit_is_picked_up(self):
+        self.write_preset("news", "first", 1_000_000_000)
+        self.assertEqual(util.get_preset_content("news"), "first")
+
+        # Rewriting the file in place leaves the folder mtime unchanged
+        folder_mtime_ns = os.stat(self._tmp.name).st_mtime_ns
+        self.write_preset("news", "second", 2_000_000_000)
+        self.assertEqual(os.stat(self._tmp.name).st_mtime_ns, folder_mtime_ns)
+
+        self.assertEqual(util.get_preset_content("news"), "second")
+        [preset] = util.get_preset_instructions()
+        self.assertEqual(preset["content"], "second")
+
+    def test_unknown_preset_is_empty(self):
+        self.write_preset("news", "first", 1_000_000_000)
+        self.assertEqual(util.get_preset_content("../prompt"), "")
+        self.assertEqual(util.get_preset_content("missing"), "")
+
+    def test_lookup_reads_only_the_requested_preset(self):
+        self.write_preset("news", "news text", 1_000_000_000)
+        self.write_preset("casual", "casual text", 1_000_000_000)
+        util.get_preset_instructions()
+
+        with mock.patch.object(
+            util, "read_prompt_file", wraps=util.read_prompt_file
+        ) as read_prompt_file:
+            self.assertEqual(util.get_preset_content("casual"), "casual text")
+        read_prompt_file.assert_called_once_with(
+            os.path.join(self._tmp.name, "preset_casual.txt")
+        )
+
+    def test_listing_returns_copies(self):
+        self.write_preset("news", "first", 1_000_000_000)
+        [preset] = util.get_preset_instructions()
+        preset["content"] = "changed"
+
+        [preset] = util.get_preset_instructions()
+        self.assertEqual(preset["content"], "first")
+        self.assertEqual(util._PRESETS_CACHE["presets"][0]["content"], "first")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,185 @@
+"""
+Tests for the append-only task log in SessionManager.
+Run from the repository root with: python -m unittest
+"""
+
+import multiprocessing
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from reframer.session_manager import SessionManager, fcntl
+
+
+class TaskLogCompactionTest(unittest.TestCase):
+    """Compaction should only run once the log has grown substantially."""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.user_folder = self._tmp.name
+        self.addCleanup(self._tmp.cleanup)
+
+        # Small limit so a single large task pushes the log past it
+        patcher = mock.patch.object(SessionManager, "TASK_LOG_COMPACT_BYTES", 1024)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.compactions = 0
+        compact = SessionManager._compact_task_log
+
+        def counting_compact(user_folder):
+            self.compactions += 1
+            compact(user_folder)
+
+        patcher = mock.patch.object(
+            SessionManager, "_compact_task_log", staticmethod(counting_compact)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def save_task(self, task_id, result_size):
+        SessionManager._append_task_records(
+            self.user_folder,
+            [{"task_id": task_id, "status": "pending", "result": "x" * result_size}],
+        )
+
+    def log_size(self):
+        return os.path.getsize(SessionManager._task_log_path(self.user_folder))
+
+    def test_repeated_appends_above_limit_do_not_compact_each_time(self):
+        self.save_task("big", 2048)
+        self.assertEqual(self.compactions, 1)  # New log already over the limit
+
+        for i in range(20):
+            status = "processing" if i % 2 else "failed"
+            SessionManager.update_task_status("big", self.user_folder, status)
+
+        self.assertGreater(self.log_size(), 1024)
+        self.assertEqual(self.compactions, 1)
+
+        task = SessionManager.get_task_by_id("big", self.user_folder)
+        self.assertEqual(task["status"], "processing")
+        self.assertEqual(len(task["result"]), 2048)
+
+    def test_compacts_again_once_the_log_doubles(self):
+        self.save_task("big", 2048)
+        compacted_size = self.log_size()
+
+        # Append small updates until the log would pass twice that size
+        update_size = 0
+        for _ in range(1000):
+            size_before = self.log_size()
+            SessionManager.update_task_status("big", self.user_folder, "failed", "e")
+            if self.compactions == 2:
+                break
+            update_size = self.log_size() - size_before
+        self.assertEqual(self.compactions, 2)
+        self.assertGreater(size_before + update_size, 2 * compacted_size)
+
+        # One record per task after compaction, with the updates folded in
+        with open(SessionManager._task_log_path(self.user_folder), "rb") as f:
+            self.assertEqual(len(f.readlines()), 1)
+        task = SessionManager.get_task_by_id("big", self.user_folder)
+        self.assertEqual((task["status"], task["result"]), ("failed", "e"))
+
+
+class TaskClaimTest(unittest.TestCase):
+    """A processing claim blocks other claims until it goes stale."""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.user_folder = self._tmp.name
+        self.addCleanup(self._tmp.cleanup)
+        SessionManager._append_task_records(
+            self.user_folder, [{"task_id": "t", "status": "pending"}]
+        )
+
+    def test_fresh_claim_blocks_other_claims(self):
+        self.assertTrue(SessionManager.claim_task("t", self.user_folder))
+        self.assertFalse(SessionManager.claim_task("t", self.user_folder))
+        self.assertFalse(SessionManager.fail_stale_task("t", self.user_folder))
+
+    def test_stale_claim_can_be_reclaimed_or_failed(self):
+        self.assertTrue(SessionManager.claim_task("t", self.user_folder))
+        with mock.patch.object(SessionManager, "TASK_CLAIM_TIMEOUT", -1):
+            self.assertTrue(SessionManager.claim_task("t", self.user_folder))
+            self.assertTrue(SessionManager.fail_stale_task("t", self.user_folder))
+
+        task = SessionManager.get_task_by_id("t", self.user_folder)
+        self.assertEqual(task["status"], "failed")
+        self.assertTrue(SessionManager.claim_task("t", self.user_folder))
+
+
+class TaskLogReadTest(unittest.TestCase):
+    """Reads stay consistent when the log is compacted underneath them."""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.user_folder = self._tmp.name
+        self.addCleanup(self._tmp.cleanup)
+
+    def test_compaction_during_read_returns_the_task(self):
+        SessionManager._append_task_records(
+            self.user_folder,
+            [{"task_id": t, "status": "pending"} for t in ("a", "b")],
+        )
+        for _ in range(5):
+            SessionManager.update_task_status("a", self.user_folder, "failed", "e")
+        SessionManager.update_task_status("b", self.user_folder, "completed", "ok")
+
+        # Replace the log after indexing it but before reading the records
+        task_offsets = SessionManager._task_offsets
+
+        def index_then_compact(*args):
+            offsets = task_offsets(*args)
+            with SessionManager._folder_lock(
+                self.user_folder, SessionManager.TASK_WRITE_LOCK_FILENAME
+            ):
+                SessionManager._compact_task_log(self.user_folder)
+            return offsets
+
+        with mock.patch.object(
+            SessionManager, "_task_offsets", staticmethod(index_then_compact)
+        ):
+            task = SessionManager.get_task_by_id("b", self.user_folder)
+
+        self.assertEqual((task["status"], task["result"]), ("completed", "ok"))
+        task = SessionManager.get_task_by_id("b", self.user_folder)
+        self.assertEqual((task["status"], task["result"]), ("completed", "ok"))
+
+
+def _append_tasks(user_folder, prefix, count):
+    """Save count tasks from a separate worker process."""
+    for i in range(count):
+        SessionManager._append_task_records(
+            user_folder, [{"task_id": f"{prefix}-{i}", "result": "x" * 200}]
+        )
+
+
+@unittest.skipIf(fcntl is None, "cross-process locking needs fcntl")
+class TaskLogConcurrencyTest(unittest.TestCase):
+    """Worker processes share one log and must not lose each other's writes."""
+
+    def test_concurrent_appends_and_compactions_keep_every_task(self):
+        with tempfile.TemporaryDirectory() as user_folder:
+            # Compact often so appends race with compactions
+            with mock.patch.object(SessionManager, "TASK_LOG_COMPACT_BYTES", 512):
+                context = multiprocessing.get_context("fork")
+                workers = [
+                    context.Process(target=_append_tasks, args=(user_folder, p, 80))
+                    for p in ("a", "b", "c", "d")
+                ]
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+
+            self.assertEqual([w.exitcode for w in workers], [0] * len(workers))
+            tasks = SessionManager._load_tasks(user_folder)
+            self.assertEqual(len(tasks), 80 * len(workers))
+            self.assertFalse([n for n in os.listdir(user_folder) if "tmp" in n])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+Tests for the background task pool in reframer.task.
+Run from the repository root with: python -m unittest
+"""
+
+import queue
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from reframer import task
+from reframer.session_manager import SessionManager
+
+
+class ShutdownTaskPoolTest(unittest.TestCase):
+    """Tasks an exiting worker can't finish are marked failed."""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.user_folder = self._tmp.name
+        self.addCleanup(self._tmp.cleanup)
+
+        # A one-thread pool whose tasks run until released
+        self.release = threading.Event()
+        pool = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(pool.shutdown)
+        self.addCleanup(self.release.set)  # Runs first, unblocking the pool
+        for patcher in (
+            mock.patch.object(task, "_pool", pool),
+            mock.patch.object(task, "_submitted", {}),
+            mock.patch.object(task, "_run_task", self.run_task),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_task(self, task_id, user_folder, preset_id, chunks=None):
+        if preset_id != "quick":
+            self.release.wait()
+        SessionManager.update_task_status(task_id, user_folder, "completed", "ok")
+
+    def submit(self, task_id, preset_id="", chunks=None):
+        SessionManager._append_task_records(
+            self.user_folder, [{"task_id": task_id, "status": "pending"}]
+        )
+        self.assertTrue(SessionManager.claim_task(task_id, self.user_folder))
+        return task._submit_task(task_id, self.user_folder, preset_id, chunks)
+
+    def status(self, task_id):
+        return SessionManager.get_task_by_id(task_id, self.user_folder)["status"]
+
+    def test_running_and_queued_tasks_are_failed(self):
+        running = self.submit("running")
+        chunks = queue.Queue()
+        self.submit("queued", chunks=chunks)
+
+        task.shutdown_task_pool(timeout=0.1)
+
+        self.assertTrue(running.running())
+        self.assertEqual(self.status("running"), "failed")
+        self.assertEqual(self.status("queued"), "failed")
+        # A stream waiting on the queued task is ended
+        self.assertIn("server restart", chunks.get_nowait())
+        self.assertIsNone(chunks.get_nowait())
+        self.assertTrue(SessionManager.claim_task("running", self.user_folder))
+
+    def test_tasks_finishing_within_timeout_keep_their_outcome(self):
+        self.submit("quick", preset_id="quick")
+
+        task.shutdown_task_pool(timeout=5)
+
+        self.assertEqual(self.status("quick"), "completed")
+
+
+if __name__ == "__main__":
+    unittest.main()
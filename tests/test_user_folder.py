@@ -0,0 +1,139 @@
+"""
+Tests for the per-session user folder helpers in util.
+Run from the repository root with: python -m unittest
+"""
+
+import functools
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from flask import Flask, g
+
+import reframer
+from reframer import util
+from reframer.session_manager import SessionManager
+
+
+class CachedUserFolderTest(unittest.TestCase):
+    """The cached user folder is recreated if it was removed from disk."""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        patcher = mock.patch.object(util, "UPLOAD_FOLDER", self._tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        app = Flask(__name__)
+        app.secret_key = "test"
+        context = app.test_request_context()
+        context.push()
+        self.addCleanup(context.pop)
+
+    def test_next_request_recreates_removed_user_folder(self):
+        user_folder = util.get_user_folder()
+        self.assertEqual(SessionManager.get_cached_user_folder(), user_folder)
+        shutil.rmtree(user_folder)
+
+        g.pop("user_folder")  # As in the session's next request
+        self.assertEqual(util.get_user_folder(), user_folder)
+        self.assertTrue(os.path.isdir(user_folder))
+
+
+class InputCounterTest(unittest.TestCase):
+    """Input numbers are seeded from the folder once, then kept in the session."""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.user_folder = self._tmp.name
+        self.addCleanup(self._tmp.cleanup)
+
+        app = Flask(__name__)
+        app.secret_key = "test"
+        context = app.test_request_context()
+        context.push()
+        self.addCleanup(context.pop)
+
+    def next_number(self):
+        return SessionManager.get_and_increment_input_counter(self.user_folder)
+
+    def test_counter_is_seeded_from_existing_inputs(self):
+        open(os.path.join(self.user_folder, "input3.pdf"), "wb").close()
+        self.assertEqual(self.next_number(), 4)
+        # Later numbers come from the session without rescanning
+        open(os.path.join(self.user_folder, "input9.txt"), "wb").close()
+        self.assertEqual(self.next_number(), 5)
+
+    def test_releasing_the_last_number_rescans(self):
+        self.assertEqual(self.next_number(), 1)
+        self.assertEqual(self.next_number(), 2)
+        SessionManager.release_input_number(1)  # Not the last one, kept
+        self.assertEqual(self.next_number(), 3)
+        SessionManager.release_input_number(3)
+        open(os.path.join(self.user_folder, "input1.txt"), "wb").close()
+        self.assertEqual(self.next_number(), 2)
+
+    def test_missing_folder_starts_at_one(self):
+        shutil.rmtree(self.user_folder)
+        self.assertEqual(self.next_number(), 1)
+
+
+class UserFolderRouteTest(unittest.TestCase):
+    """Saving from the routes keeps working after the user folder is removed."""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        upload_folder = os.path.join(self._tmp.name, "uploads")
+        for patcher in (
+            mock.patch.object(util, "UPLOAD_FOLDER", upload_folder),
+            # Keep the session store out of the repository's instance folder
+            mock.patch.object(
+                reframer,
+                "Flask",
+                functools.partial(Flask, instance_path=self._tmp.name),
+            ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = reframer.create_app().test_client()
+
+    def add_text(self, text):
+        return self.client.post(
+            "/task/add_article", data={"input_type": "text", "article_text": text}
+        )
+
+    def session_value(self, key):
+        with self.client.session_transaction() as session:
+            return session.get(key)
+
+    def test_add_text_after_user_folder_removed(self):
+        self.assertEqual(self.add_text("first").status_code, 302)
+        [article] = self.session_value(SessionManager.CURRENT_TASK_KEY)["articles"]
+        self.client.get(f"/task/remove_article/{article['id']}")
+        self.assertIsNone(self.session_value(SessionManager.INPUT_COUNTER_KEY))
+
+        user_folder = self.session_value(SessionManager.USER_FOLDER_KEY)
+        shutil.rmtree(user_folder)
+
+        self.assertEqual(self.add_text("second").status_code, 302)
+        with open(os.path.join(user_folder, "input1.txt"), encoding="utf-8") as f:
+            self.assertEqual(f.read(), "second")
+
+    def test_add_instruction_after_user_folder_removed(self):
+        self.assertEqual(self.add_text("first").status_code, 302)
+        user_folder = self.session_value(SessionManager.USER_FOLDER_KEY)
+        shutil.rmtree(user_folder)
+
+        response = self.client.post(
+            "/task/add_instruction", data={"instruction_text": "do it"}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(os.path.isfile(os.path.join(user_folder, "instruction.txt")))
+
+
+if __name__ == "__main__":
+    unittest.main()